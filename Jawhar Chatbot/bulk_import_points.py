@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""Bulk import of recycling points into Google Sheets (admin only).
+
+Reads a CSV (columns: phone, points) or JSONL ({"phone": ..., "points": ...})
+file row by row, adds up duplicate phones, then pushes the totals to the
+Sheets web app in large chunks using a small pool of worker threads.
+
+Every chunk is tagged with "<batch-id>-<chunk-number>" and recorded in a
+local ledger file, together with a hash of its content, once the web app
+accepts it. The ledger also pins the input file hash and chunk size of each
+batch id. Re-running the same import with the same batch id after a failure
+only sends the chunks that did not make it the first time; a re-run with a
+different input file or chunk size is refused, since its chunks would no
+longer line up with the ones already applied.
+
+Usage:
+    python bulk_import_points.py drive_2025_06.csv --batch-id drive-2025-06
+"""
+
+import os
+import csv
+import json
+import time
+import hashlib
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dotenv import load_dotenv
+
+from sheets_client import bulk_update_points_in_sheet
+
+# Load environment variables
+load_dotenv()
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 500
+DEFAULT_WORKERS = 4
+DEFAULT_LEDGER_FILE = 'bulk_import_ledger.jsonl'
+MAX_POINTS_PER_ROW = 100000
+
+
+def normalize_phone(raw_phone):
+    """Return the phone number in WhatsApp form (digits only, no '+')."""
+    phone = str(raw_phone).strip()
+    for char in (' ', '-', '(', ')'):
+        phone = phone.replace(char, '')
+    if phone.startswith('+'):
+        phone = phone[1:]
+    elif phone.startswith('00'):
+        phone = phone[2:]
+    if not phone.isdigit() or not 8 <= len(phone) <= 15:
+        raise ValueError(f"invalid phone number '{raw_phone}'")
+    return phone
+
+
+def parse_points(raw_points):
+    """Return the points value as an int, rejecting junk and huge values."""
+    try:
+        points = int(str(raw_points).strip())
+    except (TypeError, ValueError):
+        raise ValueError(f"invalid points value '{raw_points}'")
+    if abs(points) > MAX_POINTS_PER_ROW:
+        raise ValueError(f"points value {points} exceeds {MAX_POINTS_PER_ROW}")
+    return points
+
+
+def iter_rows(path):
+    """Yield (line_number, raw_row) pairs from a CSV or JSONL file.
+
+    The file is read one line at a time so it never has to fit in memory.
+    CSV headers are matched case-insensitively; a CSV without phone and
+    points columns raises ValueError before any row is read.
+    """
+    # utf-8-sig drops the byte order mark Excel puts at the start of CSV files
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        if path.endswith('.jsonl') or path.endswith('.ndjson'):
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield line_number, {'_error': f"invalid JSON: {e.msg}"}
+                    continue
+                if not isinstance(row, dict):
+                    row = {'_error': f"expected a JSON object, got {json.dumps(row)}"}
+                yield line_number, row
+        else:
+            reader = csv.DictReader(f)
+            if reader.fieldnames is not None:
+                reader.fieldnames = [(name or '').strip().lower() for name in reader.fieldnames]
+            missing = [column for column in ('phone', 'points') if column not in (reader.fieldnames or [])]
+            if missing:
+                raise ValueError(f"{path} has no {' or '.join(missing)} column "
+                                 f"(header: {', '.join(reader.fieldnames or [])})")
+            for row in reader:
+                yield reader.line_num, row
+
+
+def aggregate_points(path, errors):
+    """Validate every row and return {phone: total_points}.
+
+    Rows that fail validation are appended to `errors` as
+    (line_number, raw_row, message) and skipped.
+    """
+    totals = {}
+    rows_read = 0
+    for line_number, row in iter_rows(path):
+        rows_read += 1
+        try:
+            if '_error' in row:
+                raise ValueError(row['_error'])
+            phone = normalize_phone(row.get('phone', ''))
+            points = parse_points(row.get('points'))
+        except (TypeError, ValueError, AttributeError) as e:
+            errors.append((line_number, row, str(e)))
+            continue
+        totals[phone] = totals.get(phone, 0) + points
+    return totals, rows_read
+
+
+def file_sha256(path):
+    """Return the SHA-256 of a file, reading it in blocks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_sha256(updates):
+    """Return the SHA-256 of a chunk's content."""
+    return hashlib.sha256(json.dumps(updates, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def load_ledger(ledger_file):
+    """Return ({batch_id: batch_record}, {chunk_id: content_sha256}) from the ledger."""
+    batches = {}
+    chunks = {}
+    if not os.path.exists(ledger_file):
+        return batches, chunks
+    with open(ledger_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+                if 'chunk_id' in entry:
+                    chunks[entry['chunk_id']] = entry.get('content_sha256')
+                elif 'batch_id' in entry:
+                    batches[entry['batch_id']] = entry
+            except (json.JSONDecodeError, TypeError):
+                continue
+    return batches, chunks
+
+
+def check_batch(batches, batch_id, input_sha256, chunk_size):
+    """Raise ValueError if `batch_id` was started with another input or chunk size."""
+    batch = batches.get(batch_id)
+    if batch is None:
+        return
+    if batch.get('input_sha256') != input_sha256:
+        raise ValueError(f"batch {batch_id} was started with a different input file")
+    if batch.get('chunk_size') != chunk_size:
+        raise ValueError(f"batch {batch_id} was started with --chunk-size {batch.get('chunk_size')}")
+
+
+def record_batch(ledger_file, batch_id, input_sha256, chunk_size):
+    """Pin the input file hash and chunk size of a new batch in the ledger."""
+    with open(ledger_file, 'a', encoding='utf-8') as ledger:
+        ledger.write(json.dumps({"batch_id": batch_id,
+                                 "input_sha256": input_sha256,
+                                 "chunk_size": chunk_size,
+                                 "started_at": int(time.time())}) + "\n")
+
+
+def build_chunks(totals, batch_id, chunk_size):
+    """Split the totals into chunks with stable ids.
+
+    Phones are sorted so the same input file, chunk size and batch id always
+    produce the same chunks.
+    """
+    phones = sorted(phone for phone, points in totals.items() if points != 0)
+    for index, start in enumerate(range(0, len(phones), chunk_size)):
+        chunk_id = f"{batch_id}-{index:05d}"
+        updates = [{"phone": phone, "points": totals[phone]}
+                   for phone in phones[start:start + chunk_size]]
+        yield chunk_id, updates
+
+
+def check_chunk_result(result):
+    """Return the per-phone errors of a successful chunk result.
+
+    Raises ValueError if the web app did not accept the chunk or returned
+    something other than the expected JSON object.
+    """
+    if not isinstance(result, dict):
+        raise ValueError(f"unexpected response {result!r}")
+    if result.get("status") != "success":
+        raise ValueError(result.get("message", "no response"))
+    errors = result.get("errors") or []
+    if not isinstance(errors, list) or not all(isinstance(item, dict) for item in errors):
+        raise ValueError(f"unexpected errors list {errors!r}")
+    return [(item.get("phone"), item.get("message", "rejected")) for item in errors]
+
+
+def push_chunks(chunks, admin_secret, ledger_file, workers):
+    """Send chunks to the web app and record the successful ones.
+
+    Returns (rows_applied, failed_chunk_ids, row_errors).
+    """
+    ledger_lock = threading.Lock()
+    rows_applied = 0
+    failed_chunks = []
+    row_errors = []
+
+    def send(chunk_id, updates):
+        return bulk_update_points_in_sheet(updates, admin_secret, chunk_id)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor, \
+            open(ledger_file, 'a', encoding='utf-8') as ledger:
+        futures = {executor.submit(send, chunk_id, updates): (chunk_id, updates)
+                   for chunk_id, updates in chunks}
+        for future in as_completed(futures):
+            chunk_id, updates = futures[future]
+            # A bad result only fails its own chunk, so every chunk that did
+            # succeed still reaches the ledger
+            try:
+                result = future.result()
+                chunk_errors = check_chunk_result(result)
+            except Exception as e:
+                logger.error(f"❌ Chunk {chunk_id} failed: {e}")
+                failed_chunks.append(chunk_id)
+                continue
+
+            # The web app may reject individual phones (e.g. not registered)
+            row_errors.extend(chunk_errors)
+            rows_applied += len(updates) - len(chunk_errors)
+
+            with ledger_lock:
+                ledger.write(json.dumps({"chunk_id": chunk_id,
+                                         "content_sha256": chunk_sha256(updates),
+                                         "rows": len(updates),
+                                         "applied_at": int(time.time())}) + "\n")
+                ledger.flush()
+            logger.info(f"✅ Chunk {chunk_id} applied ({len(updates)} phones)")
+
+    return rows_applied, failed_chunks, row_errors
+
+
+def write_error_report(report_file, parse_errors, row_errors):
+    """Write every rejected row to a CSV report."""
+    with open(report_file, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['stage', 'line', 'phone', 'row', 'error'])
+        for line_number, row, message in parse_errors:
+            phone = row.get('phone', '') if isinstance(row, dict) else ''
+            writer.writerow(['validate', line_number, phone, json.dumps(row), message])
+        for phone, message in row_errors:
+            writer.writerow(['sheets', '', phone, '', message])
+
+
+def main():
+    """Main function."""
+    parser = argparse.ArgumentParser(description="Bulk import recycling points into Google Sheets.")
+    parser.add_argument('input_file', help="CSV (phone,points) or JSONL file")
+    parser.add_argument('--batch-id', required=True,
+                        help="unique id for this import; reuse it to resume a failed run")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--ledger', default=DEFAULT_LEDGER_FILE)
+    parser.add_argument('--error-report', default=None,
+                        help="CSV file for rejected rows (default: <batch-id>_errors.csv)")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="validate and aggregate only, do not update the sheet")
+    args = parser.parse_args()
+
+    admin_secret = os.getenv('SHEETS_ADMIN_SECRET')
+    if not admin_secret and not args.dry_run:
+        logger.error("Missing SHEETS_ADMIN_SECRET in .env file")
+        return 1
+
+    if args.chunk_size < 1:
+        logger.error("--chunk-size must be at least 1")
+        return 1
+    if args.workers < 1:
+        logger.error("--workers must be at least 1")
+        return 1
+
+    # Refuse to resume a batch with a different input before doing any work
+    input_sha256 = file_sha256(args.input_file)
+    batches, done = load_ledger(args.ledger)
+    try:
+        check_batch(batches, args.batch_id, input_sha256, args.chunk_size)
+    except ValueError as e:
+        logger.error(f"❌ {e}. Use a new --batch-id for a new import.")
+        return 1
+
+    start_time = time.time()
+    parse_errors = []
+    try:
+        totals, rows_read = aggregate_points(args.input_file, parse_errors)
+    except ValueError as e:
+        logger.error(f"❌ {e}")
+        return 1
+    parse_time = time.time() - start_time
+    logger.info(f"📄 Read {rows_read} rows for {len(totals)} phones in {parse_time:.2f}s "
+                f"({rows_read / max(parse_time, 1e-6):.0f} rows/s), {len(parse_errors)} invalid")
+
+    chunks = list(build_chunks(totals, args.batch_id, args.chunk_size))
+    pending = []
+    for chunk_id, updates in chunks:
+        if chunk_id not in done:
+            pending.append((chunk_id, updates))
+        elif done[chunk_id] != chunk_sha256(updates):
+            logger.error(f"❌ Chunk {chunk_id} in the ledger does not match this input. "
+                         f"Use a new --batch-id for a new import.")
+            return 1
+    if len(pending) < len(chunks):
+        logger.info(f"⏭️  Skipping {len(chunks) - len(pending)} chunks already applied")
+
+    rows_applied, failed_chunks, row_errors = 0, [], []
+    if args.dry_run:
+        logger.info(f"🧪 Dry run: {len(pending)} chunks would be sent")
+    elif pending:
+        if args.batch_id not in batches:
+            record_batch(args.ledger, args.batch_id, input_sha256, args.chunk_size)
+        push_start = time.time()
+        rows_applied, failed_chunks, row_errors = push_chunks(
+            pending, admin_secret, args.ledger, args.workers)
+        push_time = time.time() - push_start
+        logger.info(f"📤 Applied {rows_applied} phones in {push_time:.2f}s "
+                    f"({rows_applied / max(push_time, 1e-6):.0f} phones/s)")
+
+    if parse_errors or row_errors:
+        report_file = args.error_report or f"{args.batch_id}_errors.csv"
+        write_error_report(report_file, parse_errors, row_errors)
+        logger.info(f"📝 {len(parse_errors) + len(row_errors)} rejected rows written to {report_file}")
+
+    total_time = time.time() - start_time
+    print("\n" + "="*50)
+    print(f"Rows read:       {rows_read}")
+    print(f"Phones:          {len(totals)}")
+    print(f"Invalid rows:    {len(parse_errors)}")
+    print(f"Phones applied:  {rows_applied}")
+    print(f"Phones rejected: {len(row_errors)}")
+    print(f"Failed chunks:   {len(failed_chunks)}")
+    print(f"Total time:      {total_time:.2f}s ({rows_read / max(total_time, 1e-6):.0f} rows/s)")
+    print("="*50)
+
+    if failed_chunks:
+        logger.error(f"❌ {len(failed_chunks)} chunks failed. Re-run with --batch-id {args.batch_id} to retry them.")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
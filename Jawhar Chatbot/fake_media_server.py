@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""Local stand-in for the Graph API media endpoints.
+
+Serves `GET /<media_id>` with the same JSON shape as Graph
+({"url", "mime_type", "sha256", "file_size", "id"}) and the file itself at
+`GET /files/<media_id>`, streamed in chunks. Point the bot at it with
+
+    GRAPH_API_BASE_URL=http://127.0.0.1:8001 python webhook_server.py
+
+Media is added with `add_media()` or, when run as a script, from the files
+in a directory (the file name is used as the media id).
+"""
+
+import os
+import json
+import hashlib
+import logging
+import argparse
+import mimetypes
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+
+class FakeMediaServer:
+    """Threaded HTTP server holding media files by id."""
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.media = {}  # {media_id: (path, mime_type, content_length)}
+        self.requests = []  # Paths requested, for assertions in tests
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def add_media(self, media_id, path, mime_type=None, content_length=True):
+        """Serve the file at `path` under `media_id`.
+
+        With content_length=False the download is sent without a
+        Content-Length header, so clients only learn the size by reading it.
+        """
+        mime_type = mime_type or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self.media[media_id] = (path, mime_type, content_length)
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests.append(self.path)
+                parts = self.path.strip('/').split('/')
+                if len(parts) == 2 and parts[0] == 'files':
+                    self._send_file(parts[1])
+                elif len(parts) == 1:
+                    self._send_metadata(parts[0])
+                else:
+                    self.send_error(404)
+
+            def _send_metadata(self, media_id):
+                if media_id not in server.media:
+                    self.send_error(404)
+                    return
+                path, mime_type, _ = server.media[media_id]
+                digest = hashlib.sha256()
+                with open(path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                        digest.update(chunk)
+                body = json.dumps({
+                    "messaging_product": "whatsapp",
+                    "url": f"{server.base_url}/files/{media_id}",
+                    "mime_type": mime_type,
+                    "sha256": digest.hexdigest(),
+                    "file_size": os.path.getsize(path),
+                    "id": media_id
+                }).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_file(self, media_id):
+                if media_id not in server.media:
+                    self.send_error(404)
+                    return
+                path, mime_type, content_length = server.media[media_id]
+                self.send_response(200)
+                self.send_header('Content-Type', mime_type)
+                if content_length:
+                    self.send_header('Content-Length', str(os.path.getsize(path)))
+                else:
+                    # HTTP/1.0 without a length: the body ends when the connection closes
+                    self.send_header('Connection', 'close')
+                self.end_headers()
+                with open(path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                        self.wfile.write(chunk)
+
+            def handle(self):
+                # Clients abort downloads that are too large; that is not an error here
+                try:
+                    super().handle()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def finish(self):
+                try:
+                    super().finish()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        return Handler
+
+    def serve_forever(self):
+        """Serve in the current thread until interrupted."""
+        try:
+            self._server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._server.server_close()
+
+    def start(self):
+        """Serve in a background thread and return the base URL."""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    """Main function."""
+    parser = argparse.ArgumentParser(description="Fake Graph API media server.")
+    parser.add_argument('directory', help="directory with files to serve")
+    parser.add_argument('--port', type=int, default=8001)
+    args = parser.parse_args()
+
+    server = FakeMediaServer(port=args.port)
+    for name in sorted(os.listdir(args.directory)):
+        path = os.path.join(args.directory, name)
+        if os.path.isfile(path):
+            server.add_media(name, path)
+            logger.info(f"📎 Serving {name}")
+
+    logger.info(f"🚀 Fake media server on {server.base_url}")
+    server.serve_forever()
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
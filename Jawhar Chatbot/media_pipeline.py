@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""Download and process image/document messages off the request path.
+
+A media message only carries a Graph media id. The pipeline resolves it to
+a download URL, streams the file to disk in chunks (checking the size limit
+and hashing as it goes), stores it under its SHA-256 so the same file is
+only kept once, and then hands an open file to the processors registered
+for its MIME type.
+
+All of this runs in a small thread pool; the webhook only submits the job.
+Point GRAPH_API_BASE_URL at fake_media_server.py to run it without Meta.
+"""
+
+import os
+import base64
+import hashlib
+import logging
+import tempfile
+import mimetypes
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+GRAPH_API_BASE_URL = os.getenv('GRAPH_API_BASE_URL', 'https://graph.facebook.com/v18.0')
+MEDIA_STORAGE_DIR = os.getenv('MEDIA_STORAGE_DIR', 'media')
+MEDIA_DOWNLOAD_WORKERS = int(os.getenv('MEDIA_DOWNLOAD_WORKERS', '4'))
+MEDIA_MAX_PENDING = int(os.getenv('MEDIA_MAX_PENDING', '32'))
+CHUNK_SIZE = 64 * 1024
+
+# WhatsApp's own limits per message type
+MAX_MEDIA_BYTES = {
+    'image': 5 * 1024 * 1024,
+    'document': 100 * 1024 * 1024,
+}
+
+
+class MediaError(Exception):
+    """Raised when a media file cannot be resolved or downloaded."""
+
+
+# Processors registered per MIME type prefix, e.g. "image/" or "application/pdf"
+_processors = []  # [(mime_prefix, func)]
+
+
+def register_processor(mime_prefix):
+    """Decorator registering `func(file, media)` for matching MIME types.
+
+    `file` is an open binary file positioned at the start. `media` is a dict
+    with from_number, message_type, mime_type, sha256, path, size, caption,
+    filename and duplicate. The processor may return a reply text, which is
+    sent back to the user; if none does, a plain acknowledgement is sent.
+    """
+    def decorator(func):
+        _processors.append((mime_prefix, func))
+        return func
+    return decorator
+
+
+def get_processors(mime_type):
+    """Return the processors registered for a MIME type, in registration order."""
+    return [func for prefix, func in _processors if mime_type.startswith(prefix)]
+
+
+def _auth_headers():
+    access_token = os.getenv('WHATSAPP_API_TOKEN')
+    if not access_token:
+        raise MediaError("Missing WhatsApp API credentials")
+    return {'Authorization': f'Bearer {access_token}'}
+
+
+def resolve_media(media_id, timeout=10):
+    """Return the Graph metadata (url, mime_type, sha256, file_size) for a media id."""
+    url = f"{GRAPH_API_BASE_URL}/{media_id}"
+    try:
+        response = requests.get(url, headers=_auth_headers(), timeout=timeout)
+    except requests.exceptions.RequestException as e:
+        raise MediaError(f"could not resolve media {media_id}: {e}")
+    if response.status_code != 200:
+        raise MediaError(f"could not resolve media {media_id}: {response.status_code} {response.text}")
+    return response.json()
+
+
+def normalize_sha256(value):
+    """Return a Graph sha256 value (hex or base64) as lowercase hex, or None."""
+    if not value or not isinstance(value, str):
+        return None
+    value = value.strip()
+    if len(value) == 64:
+        try:
+            bytes.fromhex(value)
+            return value.lower()
+        except ValueError:
+            pass
+    try:
+        raw = base64.b64decode(value, validate=True)
+    except ValueError:
+        return None
+    return raw.hex() if len(raw) == 32 else None
+
+
+def media_path(storage_dir, sha256, mime_type=''):
+    """Return where a file with this hash and MIME type is stored."""
+    extension = mimetypes.guess_extension(mime_type.split(';')[0].strip()) or ''
+    return os.path.join(storage_dir, sha256 + extension)
+
+
+def download_media(url, storage_dir, max_bytes, mime_type='', expected_sha256=None, timeout=30):
+    """Stream a media file to `storage_dir` and return (path, sha256, size, duplicate).
+
+    The file is written in CHUNK_SIZE pieces and never held in memory as a
+    whole. Files are named by their SHA-256, so a file that was already
+    downloaded is detected and the new copy is discarded. If
+    `expected_sha256` is given, a file with a different hash is rejected.
+    """
+    os.makedirs(storage_dir, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+
+    fd, tmp_path = tempfile.mkstemp(dir=storage_dir, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as f, \
+                requests.get(url, headers=_auth_headers(), stream=True, timeout=timeout) as response:
+            if response.status_code != 200:
+                raise MediaError(f"download failed: {response.status_code}")
+            content_length = response.headers.get('Content-Length')
+            if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+                raise MediaError(f"file is too large ({content_length} bytes)")
+
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise MediaError(f"file is larger than {max_bytes} bytes")
+                digest.update(chunk)
+                f.write(chunk)
+    except requests.exceptions.RequestException as e:
+        os.remove(tmp_path)
+        raise MediaError(f"download failed: {e}")
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+    sha256 = digest.hexdigest()
+    if expected_sha256 and sha256 != expected_sha256:
+        os.remove(tmp_path)
+        raise MediaError(f"SHA-256 mismatch (expected {expected_sha256}, got {sha256})")
+    path = media_path(storage_dir, sha256, mime_type)
+    if os.path.exists(path):
+        os.remove(tmp_path)
+        return path, sha256, size, True
+    os.replace(tmp_path, path)
+    return path, sha256, size, False
+
+
+class MediaPipeline:
+    """Bounded pool that downloads and processes incoming media messages."""
+
+    def __init__(self, reply=None, storage_dir=MEDIA_STORAGE_DIR,
+                 workers=MEDIA_DOWNLOAD_WORKERS, max_pending=MEDIA_MAX_PENDING):
+        self.reply = reply
+        self.storage_dir = storage_dir
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='media')
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def submit(self, from_number, message_type, media_message):
+        """Queue a media message for processing.
+
+        Returns False without queueing if too many downloads are pending.
+        """
+        if not self._slots.acquire(blocking=False):
+            logger.warning(f"📎 Media queue full, dropping {message_type} from {from_number}")
+            return False
+
+        def run():
+            try:
+                self.process(from_number, message_type, media_message)
+            except Exception as e:
+                logger.error(f"Error processing media from {from_number}: {e}")
+            finally:
+                self._slots.release()
+
+        self._executor.submit(run)
+        return True
+
+    def process(self, from_number, message_type, media_message):
+        """Resolve, download and process one media message (runs in the pool)."""
+        media_id = media_message.get('id')
+        try:
+            info = resolve_media(media_id)
+            mime_type = info.get('mime_type') or media_message.get('mime_type') or ''
+            max_bytes = MAX_MEDIA_BYTES.get(message_type, MAX_MEDIA_BYTES['image'])
+            if int(info.get('file_size') or 0) > max_bytes:
+                raise MediaError(f"file is too large ({info['file_size']} bytes)")
+
+            # Graph tells us the hash up front, so a file we already have is not fetched again
+            expected_sha256 = normalize_sha256(info.get('sha256'))
+            known_path = media_path(self.storage_dir, expected_sha256, mime_type) if expected_sha256 else None
+            if known_path and os.path.exists(known_path):
+                path, sha256, size, duplicate = known_path, expected_sha256, os.path.getsize(known_path), True
+            else:
+                path, sha256, size, duplicate = download_media(
+                    info['url'], self.storage_dir, max_bytes, mime_type, expected_sha256)
+            logger.info(f"📎 Stored {message_type} {media_id} as {os.path.basename(path)} "
+                        f"({size} bytes{', duplicate' if duplicate else ''})")
+        except (MediaError, KeyError, ValueError) as e:
+            logger.error(f"❌ Media {media_id} from {from_number}: {e}")
+            self._reply(from_number, "Sorry, we couldn't download your file. "
+                                     "Please make sure it's under the size limit and try again.")
+            return
+
+        media = {
+            "from_number": from_number,
+            "message_type": message_type,
+            "media_id": media_id,
+            "mime_type": mime_type,
+            "sha256": sha256,
+            "path": path,
+            "size": size,
+            "duplicate": duplicate,
+            "caption": media_message.get('caption', ''),
+            "filename": media_message.get('filename', ''),
+        }
+        replied = False
+        for processor in get_processors(mime_type):
+            try:
+                with open(path, 'rb') as f:
+                    reply_text = processor(f, media)
+            except Exception as e:
+                logger.error(f"Error in media processor {processor.__name__}: {e}")
+                continue
+            if reply_text:
+                self._reply(from_number, reply_text)
+                replied = True
+
+        if not replied:
+            self._reply(from_number, acknowledgement(media))
+
+    def _reply(self, to_number, message):
+        if self.reply:
+            self.reply(to_number, message)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
+def acknowledgement(media):
+    """Reply sent when no processor had anything to say about the file."""
+    if media["duplicate"]:
+        return "📎 We've already received this file - thanks!"
+    if media["message_type"] == 'image':
+        return "📷 Thanks, we've received your photo! ♻️"
+    return "📄 Thanks, we've received your document!"
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""Reply templates and outbound message coalescing.
+
+Reply texts live in TEMPLATES, one dict per language. They are compiled
+once at import: static texts become final strings and texts with {fields}
+are split into literal/field pieces, so rendering a reply is a single join.
+A template given as a tuple is a multi-part reply.
+
+ReplyTurn collects every part the bot wants to send to one user while it
+handles one incoming message and sends them as few WhatsApp messages as
+the text length limit allows. record_send() counts outbound API calls per
+conversation (a run of messages to one recipient without an idle gap of
+CONVERSATION_IDLE_SECONDS) so the effect can be watched on /metrics.
+"""
+
+import re
+import time
+import string
+import threading
+
+# WhatsApp limit for the body of a text message
+MAX_TEXT_LENGTH = 4096
+
+DEFAULT_LANGUAGE = 'en'
+
+# A conversation ends after this long without an outbound message
+CONVERSATION_IDLE_SECONDS = 30 * 60
+
+TEMPLATES = {
+    'en': {
+        'welcome_back': "👋 Hello {name}! Welcome back. How can I help you today?",
+        'welcome_new': (
+            "👋 Hello and welcome!",
+            "I'm Jawhar, your friendly recycling assistant. ♻️",
+            "Whether you are unsure about what to recycle, where to take items, or how to reduce waste I'm here to make it easy. 🌍✨",
+            "I noticed you haven't registered yet - no worries! It's quick and easy.",
+            "To get registered reply with your name.",
+        ),
+        'registered': "✅ Thank you, {name}! You have been registered successfully.",
+        'register_failed': "❌ Sorry, there was a problem registering you. Please try again later.",
+    },
+    'ar': {
+        'welcome_back': "👋 أهلاً {name}! مرحباً بعودتك. كيف يمكنني مساعدتك اليوم؟",
+        'welcome_new': (
+            "👋 أهلاً وسهلاً!",
+            "أنا جوهر، مساعدك الودود لإعادة التدوير. ♻️",
+            "سواء لم تكن متأكداً مما يمكن إعادة تدويره، أو أين تأخذ الأغراض، أو كيف تقلل النفايات، أنا هنا لأجعل الأمر سهلاً. 🌍✨",
+            "لاحظت أنك لم تسجل بعد - لا تقلق! التسجيل سريع وسهل.",
+            "للتسجيل أرسل اسمك.",
+        ),
+        'registered': "✅ شكراً {name}! تم تسجيلك بنجاح.",
+        'register_failed': "❌ عذراً، حدثت مشكلة أثناء تسجيلك. يرجى المحاولة لاحقاً.",
+    },
+}
+
+ARABIC_PATTERN = re.compile(r'[؀-ۿ]')
+
+
+class _CompiledTemplate:
+    """A reply text split into literal and {field} pieces once."""
+
+    _formatter = string.Formatter()
+
+    def __init__(self, text):
+        self.pieces = []  # [(literal, field_name or None, conversion, format_spec)]
+        for literal, field, format_spec, conversion in self._formatter.parse(text):
+            if field is not None and (field == '' or field[0].isdigit()):
+                raise ValueError(f"template fields must be named: {text!r}")
+            self.pieces.append((literal, field, conversion, format_spec))
+        if all(field is None for _, field, _, _ in self.pieces):
+            # Joining the literals also turns escaped {{ and }} into single braces
+            self.static = ''.join(literal for literal, _, _, _ in self.pieces)
+        else:
+            self.static = None
+
+    def render(self, values):
+        if self.static is not None:
+            return self.static
+        formatter = self._formatter
+        rendered = []
+        for literal, field, conversion, format_spec in self.pieces:
+            rendered.append(literal)
+            if field is None:
+                continue
+            # Same semantics as str.format: {user.name}, {n!r}, {n:>5}
+            value = formatter.convert_field(formatter.get_field(field, (), values)[0], conversion)
+            if '{' in format_spec:
+                format_spec = formatter.vformat(format_spec, (), values)
+            rendered.append(format(value, format_spec))
+        return ''.join(rendered)
+
+
+def _compile(templates):
+    compiled = {}
+    for language, entries in templates.items():
+        compiled[language] = {}
+        for key, text in entries.items():
+            parts = text if isinstance(text, tuple) else (text,)
+            compiled[language][key] = tuple(_CompiledTemplate(part) for part in parts)
+    return compiled
+
+
+_compiled_templates = _compile(TEMPLATES)
+
+
+def detect_language(text):
+    """Pick the reply language for a message (Arabic script or English)."""
+    if text and ARABIC_PATTERN.search(text):
+        return 'ar'
+    return DEFAULT_LANGUAGE
+
+
+def render_parts(key, language=DEFAULT_LANGUAGE, **values):
+    """Render a template and return its parts as a list of strings."""
+    templates = _compiled_templates.get(language) or _compiled_templates[DEFAULT_LANGUAGE]
+    parts = templates.get(key) or _compiled_templates[DEFAULT_LANGUAGE][key]
+    return [part.render(values) for part in parts]
+
+
+def render(key, language=DEFAULT_LANGUAGE, **values):
+    """Render a template as one message, joining multiple parts with newlines."""
+    return "\n".join(render_parts(key, language, **values))
+
+
+def coalesce(parts, limit=MAX_TEXT_LENGTH):
+    """Pack consecutive parts into as few messages of at most `limit` characters."""
+    messages = []
+    current = ''
+    for part in parts:
+        # A single part over the limit has to be cut
+        while len(part) > limit:
+            if current:
+                messages.append(current)
+                current = ''
+            messages.append(part[:limit])
+            part = part[limit:]
+        if not current:
+            current = part
+        elif len(current) + 1 + len(part) <= limit:
+            current += "\n" + part
+        else:
+            messages.append(current)
+            current = part
+    if current:
+        messages.append(current)
+    return messages
+
+
+class ReplyTurn:
+    """Collect the reply parts for one recipient and send them together."""
+
+    def __init__(self, to_number, send, language=DEFAULT_LANGUAGE):
+        self.to_number = to_number
+        self.send = send
+        self.language = language
+        self.parts = []
+
+    def add(self, text):
+        if text:
+            self.parts.append(text)
+
+    def add_template(self, key, **values):
+        self.parts.extend(render_parts(key, self.language, **values))
+
+    def flush(self):
+        """Send the collected parts; return the number of messages sent."""
+        messages = coalesce(self.parts)
+        self.parts = []
+        for message in messages:
+            self.send(self.to_number, message)
+        return len(messages)
+
+
+# Outbound message counts per conversation. Open conversations are kept per
+# recipient; once one has been idle for CONVERSATION_IDLE_SECONDS it is folded
+# into the closed totals, so memory only grows with currently active users.
+_open_conversations = {}  # {phone_number: [last_send_time, messages_sent]}
+_closed_conversations = 0
+_closed_messages = 0
+_next_sweep = 0.0
+_send_counts_lock = threading.Lock()
+
+
+def _close_idle_conversations(now):
+    global _closed_conversations, _closed_messages
+    idle = [phone for phone, (last_send, _) in _open_conversations.items()
+            if now - last_send > CONVERSATION_IDLE_SECONDS]
+    for phone in idle:
+        _closed_conversations += 1
+        _closed_messages += _open_conversations.pop(phone)[1]
+
+
+def record_send(to_number):
+    """Count one outbound message in the recipient's current conversation."""
+    global _next_sweep
+    now = time.monotonic()
+    with _send_counts_lock:
+        # Sweep now and then so recipients who never come back are released
+        if now >= _next_sweep:
+            _close_idle_conversations(now)
+            _next_sweep = now + CONVERSATION_IDLE_SECONDS
+        conversation = _open_conversations.get(to_number)
+        if conversation is not None and now - conversation[0] > CONVERSATION_IDLE_SECONDS:
+            _close_idle_conversations(now)
+            conversation = None
+        if conversation is None:
+            _open_conversations[to_number] = [now, 1]
+        else:
+            conversation[0] = now
+            conversation[1] += 1
+
+
+def send_count_summary():
+    """Return outbound message totals and the average per conversation."""
+    with _send_counts_lock:
+        _close_idle_conversations(time.monotonic())
+        conversations = _closed_conversations + len(_open_conversations)
+        messages = _closed_messages + sum(count for _, count in _open_conversations.values())
+        active = len(_open_conversations)
+    return {
+        "conversations": conversations,
+        "active_conversations": active,
+        "messages_sent": messages,
+        "messages_per_conversation": round(messages / conversations, 2) if conversations else 0,
+    }
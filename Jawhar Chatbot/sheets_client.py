@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""Client for the Google Sheets web app that stores registered users and points."""
+
+import json
+import logging
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Google Sheets web app URL
+GOOGLE_SHEETS_WEBAPP_URL = "https://script.google.com/macros/s/AKfycbzp1Nhosh26AL96Ox1pKAGlXkUW4mctTDY5Xf9CiyUE0qxTfjnwLms0qkn5isFPWLpvyQ/exec"
+
+
+def register_user_in_sheet(phone, name):
+    payload = {
+        "action": "register",
+        "phone": phone,
+        "name": name
+    }
+    try:
+        response = requests.post(GOOGLE_SHEETS_WEBAPP_URL, json=payload, timeout=5)
+        print("Sheets register response:", response.text)  # Debug print
+        
+        # Try to parse as JSON first, fallback to text
+        try:
+            return response.json()
+        except json.JSONDecodeError:
+            # If not JSON, treat as text response
+            return {"status": "success", "message": response.text.strip()}
+            
+    except Exception as e:
+        logger.error(f"Error registering user in Google Sheets: {e}")
+        return {"status": "error", "message": str(e)}
+
+def find_user_in_sheet(phone):
+    payload = {
+        "action": "find",
+        "phone": phone
+    }
+    try:
+        response = requests.post(GOOGLE_SHEETS_WEBAPP_URL, json=payload, timeout=5)
+        print("Sheets find response:", response.text)  # Debug print
+        
+        # Try to parse as JSON first, fallback to text
+        try:
+            return response.json()
+        except json.JSONDecodeError:
+            # If not JSON, treat as text response
+            return {"status": "success", "message": response.text.strip()}
+            
+    except Exception as e:
+        logger.error(f"Error looking up user in Google Sheets: {e}")
+        return {"status": "error", "message": str(e)}
+
+def list_users_in_sheet(offset, limit, timeout=30):
+    """Fetch one page of the registered-user directory from Google Sheets."""
+    payload = {
+        "action": "list_users",
+        "offset": offset,
+        "limit": limit
+    }
+    try:
+        response = requests.post(GOOGLE_SHEETS_WEBAPP_URL, json=payload, timeout=timeout)
+
+        try:
+            return response.json()
+        except json.JSONDecodeError:
+            return {"status": "error", "message": "Invalid response format"}
+
+    except Exception as e:
+        logger.error(f"Error listing users in Google Sheets: {e}")
+        return {"status": "error", "message": str(e)}
+
+def check_balance_in_sheet(phone):
+    """Check user's points balance in Google Sheets."""
+    payload = {
+        "action": "check_balance",
+        "phone": phone
+    }
+    try:
+        response = requests.post(GOOGLE_SHEETS_WEBAPP_URL, json=payload, timeout=5)
+        print("Sheets balance response:", response.text)  # Debug print
+        
+        try:
+            return response.json()
+        except json.JSONDecodeError:
+            return {"status": "error", "message": "Invalid response format"}
+            
+    except Exception as e:
+        logger.error(f"Error checking balance in Google Sheets: {e}")
+        return {"status": "error", "message": str(e)}
+
+def update_points_in_sheet(phone, points_to_add, admin_secret):
+    """Update user's points in Google Sheets (admin only)."""
+    payload = {
+        "action": "update_points",
+        "phone": phone,
+        "points": points_to_add,
+        "admin_secret": admin_secret
+    }
+    try:
+        response = requests.post(GOOGLE_SHEETS_WEBAPP_URL, json=payload, timeout=5)
+        print("Sheets update points response:", response.text)  # Debug print
+        
+        try:
+            return response.json()
+        except json.JSONDecodeError:
+            return {"status": "error", "message": "Invalid response format"}
+            
+    except Exception as e:
+        logger.error(f"Error updating points in Google Sheets: {e}")
+        return {"status": "error", "message": str(e)}
+
+def bulk_update_points_in_sheet(updates, admin_secret, batch_id, timeout=30):
+    """Update many users' points in one Google Sheets call (admin only).
+
+    `updates` is a list of {"phone": ..., "points": ...} dicts. `batch_id`
+    identifies this chunk so the web app can ignore a chunk it has already
+    applied.
+    """
+    payload = {
+        "action": "bulk_update_points",
+        "batch_id": batch_id,
+        "updates": updates,
+        "admin_secret": admin_secret
+    }
+    try:
+        response = requests.post(GOOGLE_SHEETS_WEBAPP_URL, json=payload, timeout=timeout)
+        logger.debug(f"Sheets bulk update response: {response.text}")
+
+        try:
+            return response.json()
+        except json.JSONDecodeError:
+            return {"status": "error", "message": "Invalid response format"}
+
+    except Exception as e:
+        logger.error(f"Error bulk updating points in Google Sheets: {e}")
+        return {"status": "error", "message": str(e)}
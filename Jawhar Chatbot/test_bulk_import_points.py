@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Tests for the bulk points import with the Sheets call stubbed out
+"""
+
+import os
+import sys
+import json
+
+import pytest
+
+# Add current directory to path to import the import script
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import bulk_import_points
+
+
+@pytest.fixture
+def sheet(monkeypatch, tmp_path):
+    """Stub the Sheets bulk update; `sheet.responses` can override results per chunk id."""
+    class Sheet:
+        def __init__(self):
+            self.sent = []
+            self.responses = {}
+
+        def bulk_update(self, updates, admin_secret, batch_id):
+            self.sent.append(batch_id)
+            return self.responses.get(batch_id, {"status": "success"})
+
+    stub = Sheet()
+    monkeypatch.setattr(bulk_import_points, 'bulk_update_points_in_sheet', stub.bulk_update)
+    monkeypatch.setenv('SHEETS_ADMIN_SECRET', 'secret')
+    monkeypatch.chdir(tmp_path)
+    return stub
+
+
+def run_import(monkeypatch, *args):
+    monkeypatch.setattr(sys, 'argv', ['bulk_import_points.py', *args])
+    return bulk_import_points.main()
+
+
+def write_csv(path, rows, header='phone,points'):
+    path.write_text(header + '\n' + ''.join(f"{phone},{points}\n" for phone, points in rows),
+                    encoding='utf-8')
+    return str(path)
+
+
+def test_rerun_skips_applied_chunks(sheet, monkeypatch, tmp_path):
+    input_file = write_csv(tmp_path / 'drive.csv', [('96170000001', 10), ('96170000002', 5),
+                                                   ('96170000001', 3)])
+
+    assert run_import(monkeypatch, input_file, '--batch-id', 'X', '--chunk-size', '1') == 0
+    assert sorted(sheet.sent) == ['X-00000', 'X-00001']
+
+    sheet.sent.clear()
+    assert run_import(monkeypatch, input_file, '--batch-id', 'X', '--chunk-size', '1') == 0
+    assert sheet.sent == []
+
+
+def test_failed_chunk_is_retried(sheet, monkeypatch, tmp_path):
+    input_file = write_csv(tmp_path / 'drive.csv', [('96170000001', 10), ('96170000002', 5),
+                                                   ('96170000003', 1), ('96170000004', 2)])
+    sheet.responses = {'X-00001': {"status": "error", "message": "quota"},
+                       'X-00002': ["ok"],
+                       'X-00003': {"status": "success", "errors": ["bad"]}}
+
+    assert run_import(monkeypatch, input_file, '--batch-id', 'X', '--chunk-size', '1') == 1
+    assert len(sheet.sent) == 4
+
+    # Only the chunks that failed are sent again
+    sheet.sent.clear()
+    sheet.responses = {}
+    assert run_import(monkeypatch, input_file, '--batch-id', 'X', '--chunk-size', '1') == 0
+    assert sorted(sheet.sent) == ['X-00001', 'X-00002', 'X-00003']
+
+
+def test_resume_with_different_input_or_chunk_size_is_refused(sheet, monkeypatch, tmp_path):
+    path = tmp_path / 'drive.csv'
+    input_file = write_csv(path, [('96170000001', 10), ('96170000002', 5)])
+    assert run_import(monkeypatch, input_file, '--batch-id', 'X', '--chunk-size', '1') == 0
+
+    sheet.sent.clear()
+    assert run_import(monkeypatch, input_file, '--batch-id', 'X', '--chunk-size', '2') == 1
+
+    write_csv(path, [('96170000000', 1), ('96170000001', 10), ('96170000002', 5)])
+    assert run_import(monkeypatch, input_file, '--batch-id', 'X', '--chunk-size', '1') == 1
+    assert sheet.sent == []
+
+
+def test_chunk_content_mismatch_is_refused(sheet, monkeypatch, tmp_path):
+    input_file = write_csv(tmp_path / 'drive.csv', [('96170000001', 10)])
+    # A ledger from an older run that recorded different content under this chunk id
+    with open('bulk_import_ledger.jsonl', 'w', encoding='utf-8') as ledger:
+        ledger.write(json.dumps({"chunk_id": "X-00000", "content_sha256": "0" * 64}) + "\n")
+
+    assert run_import(monkeypatch, input_file, '--batch-id', 'X') == 1
+    assert sheet.sent == []
+
+
+def test_excel_csv_header_is_accepted(tmp_path):
+    path = tmp_path / 'excel.csv'
+    path.write_bytes('\ufeffPhone, Points\r\n+961 7000 0001,10\r\n'.encode('utf-8'))
+    errors = []
+
+    totals, rows_read = bulk_import_points.aggregate_points(str(path), errors)
+    assert totals == {'96170000001': 10}
+    assert errors == []
+
+
+def test_missing_columns_fail_fast(tmp_path):
+    input_file = write_csv(tmp_path / 'drive.csv', [('96170000001', 10)], header='number,amount')
+
+    with pytest.raises(ValueError, match='phone or points'):
+        bulk_import_points.aggregate_points(input_file, [])
+
+
+def test_invalid_workers_is_rejected(sheet, monkeypatch, tmp_path):
+    input_file = write_csv(tmp_path / 'drive.csv', [('96170000001', 10)])
+    assert run_import(monkeypatch, input_file, '--batch-id', 'X', '--workers', '0') == 1
+    assert sheet.sent == []
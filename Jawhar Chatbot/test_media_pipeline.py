@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Tests for the media pipeline against the local fake media server
+"""
+
+import os
+import sys
+
+import pytest
+
+# Add current directory to path to import the pipeline modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import media_pipeline
+from fake_media_server import FakeMediaServer
+
+
+@pytest.fixture
+def media_server(monkeypatch):
+    """Run the fake media server and point the pipeline at it."""
+    monkeypatch.setenv('WHATSAPP_API_TOKEN', 'test-token')
+    with FakeMediaServer() as server:
+        monkeypatch.setattr(media_pipeline, 'GRAPH_API_BASE_URL', server.base_url)
+        yield server
+
+
+@pytest.fixture
+def pipeline(tmp_path):
+    """A pipeline that collects its replies instead of sending them."""
+    replies = []
+    pipeline = media_pipeline.MediaPipeline(
+        reply=lambda to_number, message: replies.append(message),
+        storage_dir=str(tmp_path / 'store'), workers=1)
+    pipeline.replies = replies
+    yield pipeline
+    pipeline.shutdown()
+
+
+def write_file(path, size):
+    path.write_bytes(os.urandom(size))
+    return str(path)
+
+
+def test_download_and_duplicate(media_server, pipeline, tmp_path):
+    photo = write_file(tmp_path / 'photo.jpg', 300 * 1024)
+    media_server.add_media('m1', photo)
+    media_server.add_media('m2', photo)
+
+    pipeline.process('96891224954', 'image', {'id': 'm1'})
+    stored = os.listdir(pipeline.storage_dir)
+    assert len(stored) == 1
+    with open(os.path.join(pipeline.storage_dir, stored[0]), 'rb') as f, open(photo, 'rb') as original:
+        assert f.read() == original.read()
+    assert '/files/m1' in media_server.requests
+
+    # Same content under a new media id: recognised from the Graph hash, not downloaded again
+    pipeline.process('96891224954', 'image', {'id': 'm2'})
+    assert os.listdir(pipeline.storage_dir) == stored
+    assert '/m2' in media_server.requests
+    assert '/files/m2' not in media_server.requests
+    assert "already received" in pipeline.replies[-1]
+
+
+def test_oversized_file_is_rejected(media_server, pipeline, tmp_path):
+    big = write_file(tmp_path / 'big.jpg', media_pipeline.MAX_MEDIA_BYTES['image'] + 1)
+    media_server.add_media('big', big)
+
+    pipeline.process('96891224954', 'image', {'id': 'big'})
+    assert not os.path.exists(pipeline.storage_dir) or os.listdir(pipeline.storage_dir) == []
+    assert '/files/big' not in media_server.requests
+    assert "couldn't download" in pipeline.replies[-1]
+
+
+def test_download_enforces_size_limit_while_streaming(media_server, tmp_path):
+    document = write_file(tmp_path / 'doc.pdf', 200 * 1024)
+    # No Content-Length, so only the per-chunk check can catch the size
+    media_server.add_media('doc', document, content_length=False)
+    storage_dir = str(tmp_path / 'store')
+
+    with pytest.raises(media_pipeline.MediaError, match='larger than'):
+        media_pipeline.download_media(f"{media_server.base_url}/files/doc", storage_dir, 100 * 1024)
+    assert os.listdir(storage_dir) == []
+
+
+def test_download_without_content_length(media_server, tmp_path):
+    document = write_file(tmp_path / 'doc.pdf', 200 * 1024)
+    media_server.add_media('doc', document, content_length=False)
+
+    path, sha256, size, duplicate = media_pipeline.download_media(
+        f"{media_server.base_url}/files/doc", str(tmp_path / 'store'), 300 * 1024, 'application/pdf')
+    assert size == 200 * 1024
+    assert path.endswith('.pdf') and not duplicate
+
+
+def test_missing_mime_type_still_replies(media_server, pipeline, tmp_path, monkeypatch):
+    photo = write_file(tmp_path / 'photo.jpg', 1024)
+    media_server.add_media('m1', photo)
+    resolve_media = media_pipeline.resolve_media
+    monkeypatch.setattr(media_pipeline, 'resolve_media',
+                        lambda media_id: dict(resolve_media(media_id), mime_type=None))
+
+    pipeline.process('96891224954', 'image', {'id': 'm1'})
+    assert "received your photo" in pipeline.replies[-1]
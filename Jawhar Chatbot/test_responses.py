@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Tests for reply templates, message coalescing and the send-count metric
+"""
+
+import os
+import sys
+import types
+
+import pytest
+
+# Add current directory to path to import the responses module
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import responses
+from responses import coalesce, ReplyTurn, MAX_TEXT_LENGTH
+
+
+def render(text, **values):
+    return responses._CompiledTemplate(text).render(values)
+
+
+def test_templates_match_str_format():
+    user = types.SimpleNamespace(name='Sara')
+    assert render("{n:>5}|{n!r}", n='x') == "    x|'x'"
+    assert render("Hello {user.name}!", user=user) == "Hello Sara!"
+    assert render("{n:{width}}|", n=1, width=4) == "   1|"
+    assert render("x {{y}}") == "x {y}"
+    assert render("{name} {{b}}", name='a') == "a {b}"
+
+
+def test_positional_template_fields_are_rejected():
+    with pytest.raises(ValueError):
+        responses._CompiledTemplate("Hello {}!")
+
+
+def test_render_parts_per_language():
+    assert responses.render_parts('welcome_back', 'en', name='Sara') == [
+        "👋 Hello Sara! Welcome back. How can I help you today?"]
+    assert len(responses.render_parts('welcome_new', 'ar')) == 5
+    # Unknown languages fall back to English
+    assert responses.render_parts('welcome_new', 'fr') == responses.render_parts('welcome_new', 'en')
+
+
+def test_coalesce_packs_up_to_the_limit():
+    half = 'a' * (MAX_TEXT_LENGTH // 2)
+    # Two halves plus the joining newline are one character over the limit
+    assert coalesce([half, half]) == [half, half]
+    assert coalesce([half[:-1], half]) == [half[:-1] + "\n" + half]
+    assert coalesce(['a', 'b', 'c']) == ["a\nb\nc"]
+    assert coalesce([]) == []
+
+
+def test_coalesce_splits_a_part_over_the_limit():
+    long_part = 'x' * (MAX_TEXT_LENGTH * 2 + 10)
+    messages = coalesce(['intro', long_part, 'outro'])
+    assert messages == ['intro', 'x' * MAX_TEXT_LENGTH, 'x' * MAX_TEXT_LENGTH, 'x' * 10 + "\noutro"]
+    assert all(len(message) <= MAX_TEXT_LENGTH for message in messages)
+
+
+def test_reply_turn_sends_welcome_as_one_message():
+    sent = []
+    turn = ReplyTurn('96891224954', lambda to_number, message: sent.append((to_number, message)))
+    turn.add_template('welcome_new')
+    turn.add('')
+
+    assert turn.flush() == 1
+    assert sent == [('96891224954', responses.render('welcome_new'))]
+    assert turn.flush() == 0
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Fresh send-count state with a clock the test controls."""
+    monkeypatch.setattr(responses, '_open_conversations', {})
+    monkeypatch.setattr(responses, '_closed_conversations', 0)
+    monkeypatch.setattr(responses, '_closed_messages', 0)
+    monkeypatch.setattr(responses, '_next_sweep', 0.0)
+    now = types.SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(responses.time, 'monotonic', lambda: now.value)
+    return now
+
+
+def test_idle_conversations_are_closed(clock):
+    responses.record_send('1')
+    responses.record_send('1')
+    responses.record_send('2')
+    assert responses.send_count_summary() == {
+        "conversations": 2, "active_conversations": 2,
+        "messages_sent": 3, "messages_per_conversation": 1.5}
+
+    # After the idle window, the next message to '1' starts a new conversation
+    clock.value += responses.CONVERSATION_IDLE_SECONDS + 1
+    responses.record_send('1')
+    assert responses.send_count_summary() == {
+        "conversations": 3, "active_conversations": 1,
+        "messages_sent": 4, "messages_per_conversation": 1.33}
+    assert list(responses._open_conversations) == ['1']
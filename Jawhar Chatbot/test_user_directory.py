@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Tests for the memory-mapped user directory snapshot and its delta logs
+"""
+
+import os
+import sys
+
+import pytest
+
+# Add current directory to path to import the user directory module
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import user_directory
+from user_directory import UserDirectory, write_snapshot, delta_log_path, read_generation
+
+
+USERS = [('96891224954', 'Sara', 120), ('+96170000001', 'Ali', 5), ('96170000002', 'Noor', '12.5')]
+
+
+@pytest.fixture
+def snapshot_path(tmp_path):
+    return str(tmp_path / 'users.snapshot')
+
+
+def test_lookup_hit_miss_and_plus_prefix(snapshot_path):
+    assert write_snapshot(snapshot_path, USERS) == 3
+    directory = UserDirectory(snapshot_path, check_interval=0)
+
+    assert len(directory) == 3
+    assert directory.lookup('96891224954') == {"name": "Sara", "points": 120}
+    assert directory.lookup('+96170000001') == {"name": "Ali", "points": 5}
+    assert directory.lookup('96170000002') == {"name": "Noor", "points": 12}
+    assert directory.lookup('96170000003') is None
+    assert directory.lookup('not a phone') is None
+
+
+def test_lookup_over_many_users(snapshot_path):
+    write_snapshot(snapshot_path, ((str(96890000000 + i), f"user{i}", i) for i in range(0, 20000, 2)))
+    directory = UserDirectory(snapshot_path, check_interval=0)
+
+    assert directory.lookup('96890000000') == {"name": "user0", "points": 0}
+    assert directory.lookup('96890019998') == {"name": "user19998", "points": 19998}
+    assert directory.lookup('96890001234') == {"name": "user1234", "points": 1234}
+    assert directory.lookup('96890001235') is None
+
+
+def test_snapshot_replaced_under_live_directory(snapshot_path):
+    write_snapshot(snapshot_path, [('96891224954', 'Sara', 1)])
+    directory = UserDirectory(snapshot_path, check_interval=0)
+    assert directory.lookup('96891224954') == {"name": "Sara", "points": 1}
+
+    write_snapshot(snapshot_path, [('96891224954', 'Sara', 7), ('96170000001', 'Ali', 2)])
+    assert directory.lookup('96891224954') == {"name": "Sara", "points": 7}
+    assert directory.lookup('96170000001') == {"name": "Ali", "points": 2}
+    assert len(directory) == 2
+
+
+def test_registration_seen_by_other_workers(snapshot_path):
+    write_snapshot(snapshot_path, USERS)
+    worker_a = UserDirectory(snapshot_path, check_interval=0)
+    worker_b = UserDirectory(snapshot_path, check_interval=0)
+
+    worker_a.record_registration('96170000009', 'Huda')
+    assert worker_b.lookup('96170000009') == {"name": "Huda", "points": 0}
+
+
+def test_bad_delta_line_is_skipped(snapshot_path):
+    write_snapshot(snapshot_path, USERS)
+    directory = UserDirectory(snapshot_path, check_interval=0)
+    with open(delta_log_path(snapshot_path, read_generation(snapshot_path)), 'a', encoding='utf-8') as f:
+        f.write('{"phone": "96170000008", "name": "X", "points": "abc"}\n')
+        f.write('5\n')
+        f.write('{"phone": "96170000009", "name": "Huda", "points": 3}\n')
+
+    assert directory.lookup('96170000008') is None
+    assert directory.lookup('96170000009') == {"name": "Huda", "points": 3}
+    assert directory.lookup('96891224954') == {"name": "Sara", "points": 120}
+
+
+def test_refresh_rotates_delta_logs(snapshot_path, monkeypatch):
+    write_snapshot(snapshot_path, USERS)
+    directory = UserDirectory(snapshot_path, check_interval=0)
+    directory.record_registration('96170000009', 'Huda')  # In Sheets by refresh time
+    directory.record_registration('96170000010', 'Omar')  # Raced with the export
+    first_generation = read_generation(snapshot_path)
+
+    sheet_users = USERS + [('96170000009', 'Huda', 0)]
+    monkeypatch.setattr(user_directory, 'fetch_all_users', lambda page_size: iter(sheet_users))
+    user_directory.refresh_snapshot(snapshot_path)
+    second_generation = read_generation(snapshot_path)
+    user_directory.refresh_snapshot(snapshot_path)
+    third_generation = read_generation(snapshot_path)
+
+    # Only the replaced and the current generation's logs are kept
+    assert not os.path.exists(delta_log_path(snapshot_path, first_generation))
+    assert os.path.exists(delta_log_path(snapshot_path, second_generation))
+    with open(delta_log_path(snapshot_path, third_generation), 'rb') as f:
+        carried = f.read()
+    assert b'96170000010' in carried and b'96170000009' not in carried
+
+    assert directory.lookup('96170000010') == {"name": "Omar", "points": 0}
+    assert directory.lookup('96170000009') == {"name": "Huda", "points": 0}
+
+
+def test_truncated_snapshot_is_rejected(snapshot_path):
+    write_snapshot(snapshot_path, USERS)
+    with open(snapshot_path, 'r+b') as f:
+        header = f.read(user_directory.HEADER.size)
+        fields = list(user_directory.HEADER.unpack(header))
+        fields[3] = 1000000  # count far beyond the file's records
+        f.seek(0)
+        f.write(user_directory.HEADER.pack(*fields))
+
+    with pytest.raises(ValueError):
+        user_directory._Snapshot(snapshot_path)
+    directory = UserDirectory(snapshot_path, check_interval=0)
+    assert directory.lookup('96891224954') is None
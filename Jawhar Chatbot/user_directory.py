@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""Local read-only replica of the registered-user directory.
+
+The directory is stored in a single snapshot file that every worker process
+memory-maps, so the operating system keeps one shared copy in the page
+cache no matter how many workers are running.
+
+Snapshot layout (little endian):
+
+    header   magic b'JWUD', version, count, generation, generated_at
+    records  `count` fixed-size records sorted by phone:
+             phone (uint64), name offset (uint32), name length (uint16),
+             points (int32)
+    arena    UTF-8 encoded names, back to back
+
+Lookups are a binary search over the records, no parsing needed. The
+snapshot is rebuilt from Google Sheets by running this file (see `main`)
+and swapped in atomically with os.replace(), so readers never see a half
+written file.
+
+Registrations made between two refreshes are appended to a small delta log
+next to the snapshot. Each worker replays the new lines of that log on top
+of its mapped snapshot, so a user who has just registered through one worker
+is immediately known to all of them. Every snapshot has its own delta log,
+named after the snapshot's generation; a refresh starts a new log holding
+only the registrations the export did not include yet, and deletes the logs
+of older generations.
+"""
+
+import os
+import json
+import mmap
+import time
+import struct
+import logging
+import argparse
+import threading
+from dotenv import load_dotenv
+
+from sheets_client import list_users_in_sheet
+
+# Load environment variables
+load_dotenv()
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MAGIC = b'JWUD'
+SNAPSHOT_VERSION = 2
+HEADER = struct.Struct('<4sHHIQQ')  # magic, version, reserved, count, generation, generated_at
+RECORD = struct.Struct('<QIHi')     # phone, name_offset, name_length, points
+PHONE = struct.Struct('<Q')
+
+MAX_NAME_BYTES = 0xFFFF
+MIN_POINTS, MAX_POINTS = -2**31, 2**31 - 1
+CHECK_INTERVAL = 2.0  # Seconds between checks for a new snapshot or delta lines
+DEFAULT_REFRESH_INTERVAL = 900
+DEFAULT_PAGE_SIZE = 5000
+
+
+def encode_phone(phone):
+    """Return the phone number as an int, or None if it is not a phone number."""
+    phone = str(phone).strip().lstrip('+')
+    if not phone.isdigit() or len(phone) > 19:
+        return None
+    return int(phone)
+
+
+def parse_points(points):
+    """Return a points value as an int that fits a record.
+
+    Accepts ints and numeric strings such as "12" or "12.5" (truncated);
+    raises ValueError for anything else.
+    """
+    if points is None or points == '':
+        return 0
+    try:
+        value = float(points)
+    except (TypeError, ValueError):
+        raise ValueError(f"invalid points value {points!r}")
+    if value != value or value in (float('inf'), float('-inf')):
+        raise ValueError(f"invalid points value {points!r}")
+    return max(MIN_POINTS, min(MAX_POINTS, int(value)))
+
+
+def delta_log_path(snapshot_path, generation):
+    """Return the delta log that belongs to one snapshot generation."""
+    return f"{snapshot_path}.delta.{generation}"
+
+
+def parse_delta_line(line):
+    """Return (phone_int, name, points) for a delta log line.
+
+    Raises ValueError (or JSONDecodeError, a subclass) for a malformed line.
+    """
+    try:
+        entry = json.loads(line)
+        key = encode_phone(entry.get('phone', ''))
+        if key is None:
+            raise ValueError(f"invalid phone {entry.get('phone')!r}")
+        return key, str(entry.get('name', '')), parse_points(entry.get('points', 0))
+    except (TypeError, AttributeError) as e:
+        raise ValueError(str(e))
+
+
+def read_generation(path):
+    """Return the generation of the snapshot at `path`, or 0 if there is none."""
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(HEADER.size)
+    except OSError:
+        return 0
+    if len(header) < HEADER.size:
+        return 0
+    magic, version, _, _, generation, _ = HEADER.unpack(header)
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+        return 0
+    return generation
+
+
+def write_snapshot(path, users, carried_deltas=()):
+    """Write a snapshot of `users` and atomically swap it into `path`.
+
+    `users` is an iterable of (phone, name, points). Later entries for the
+    same phone win. `carried_deltas` are delta log lines of the previous
+    generation; the ones for phones missing from `users` are copied into the
+    new generation's delta log. Returns the number of users written.
+    """
+    entries = {}
+    skipped = 0
+    for phone, name, points in users:
+        key = encode_phone(phone)
+        if key is None:
+            skipped += 1
+            continue
+        try:
+            entries[key] = (str(name or ''), parse_points(points))
+        except ValueError as e:
+            logger.warning(f"Skipping user {phone} in snapshot: {e}")
+            skipped += 1
+    if skipped:
+        logger.warning(f"⚠️ Skipped {skipped} users with invalid data")
+
+    records = bytearray()
+    arena = bytearray()
+    for key in sorted(entries):
+        name, points = entries[key]
+        name_bytes = name.encode('utf-8')[:MAX_NAME_BYTES]
+        records += RECORD.pack(key, len(arena), len(name_bytes), points)
+        arena += name_bytes
+
+    # Registrations the export raced with; everything else is in the snapshot now
+    carried = []
+    for line in carried_deltas:
+        try:
+            key, _, _ = parse_delta_line(line)
+        except ValueError:
+            continue
+        if key not in entries:
+            carried.append(line.rstrip(b'\n') + b'\n')
+
+    generation = max(time.time_ns(), read_generation(path) + 1)
+    with open(delta_log_path(path, generation), 'wb') as f:
+        f.writelines(carried)
+
+    header = HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, 0, len(entries),
+                         generation, int(time.time()))
+
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        f.write(header)
+        f.write(records)
+        f.write(arena)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return len(entries)
+
+
+class _Snapshot:
+    """One memory-mapped snapshot file."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            self.identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            if stat.st_size < HEADER.size:
+                raise ValueError(f"snapshot {path} is truncated")
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, _, count, generation, generated_at = HEADER.unpack_from(self.buffer, 0)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise ValueError(f"{path} is not a user directory snapshot")
+        if stat.st_size < HEADER.size + count * RECORD.size:
+            raise ValueError(f"snapshot {path} is truncated ({count} records do not fit)")
+        self.count = count
+        self.generation = generation
+        self.generated_at = generated_at
+        self.arena_start = HEADER.size + count * RECORD.size
+
+    def find(self, key):
+        """Binary search for `key`; return (name, points) or None."""
+        buffer = self.buffer
+        low, high = 0, self.count
+        while low < high:
+            mid = (low + high) // 2
+            phone = PHONE.unpack_from(buffer, HEADER.size + mid * RECORD.size)[0]
+            if phone < key:
+                low = mid + 1
+            elif phone > key:
+                high = mid
+            else:
+                _, name_offset, name_length, points = RECORD.unpack_from(
+                    buffer, HEADER.size + mid * RECORD.size)
+                start = self.arena_start + name_offset
+                name = buffer[start:start + name_length].decode('utf-8', errors='replace')
+                return name, points
+        return None
+
+
+class UserDirectory:
+    """Read-only view of the user directory snapshot plus local deltas.
+
+    Safe to share between threads. Every process opens its own instance;
+    the mapped pages are shared by the operating system.
+    """
+
+    def __init__(self, path, check_interval=CHECK_INTERVAL):
+        self.path = path
+        self.delta_path = delta_log_path(path, 0)  # Until a snapshot is loaded
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._deltas = {}  # {phone_int: (name, points)}
+        self._delta_pos = 0
+        self._next_check = 0.0
+
+    def _maybe_reload(self):
+        """Pick up a new snapshot and new delta lines, at most every check_interval."""
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        with self._lock:
+            if now < self._next_check:
+                return
+            self._next_check = now + self.check_interval
+            self._reload_snapshot()
+            self._read_deltas()
+
+    def _reload_snapshot(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if self._snapshot is not None and self._snapshot.identity == identity:
+            return
+        try:
+            snapshot = _Snapshot(self.path)
+        except (OSError, ValueError) as e:
+            logger.error(f"Error loading user directory snapshot: {e}")
+            return
+        # The old mapping is released once no lookup holds a reference to it
+        self._snapshot = snapshot
+        self.delta_path = delta_log_path(self.path, snapshot.generation)
+        self._deltas = {}
+        self._delta_pos = 0
+        logger.info(f"📒 Loaded user directory snapshot with {snapshot.count} users")
+
+    def _read_deltas(self):
+        try:
+            with open(self.delta_path, 'rb') as f:
+                f.seek(self._delta_pos)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        # Only consume complete lines; a writer may be halfway through one
+        end = data.rfind(b'\n') + 1
+        deltas = dict(self._deltas)
+        for line in data[:end].splitlines():
+            # One bad line must not block every later lookup
+            try:
+                key, name, points = parse_delta_line(line)
+            except ValueError as e:
+                logger.warning(f"Skipping bad user directory delta line: {e}")
+                continue
+            deltas[key] = (name, points)
+        self._deltas = deltas
+        self._delta_pos += end
+
+    def lookup(self, phone):
+        """Return {"name": ..., "points": ...} for a registered phone, else None."""
+        self._maybe_reload()
+        key = encode_phone(phone)
+        if key is None:
+            return None
+        found = self._deltas.get(key)
+        if found is None:
+            snapshot = self._snapshot
+            if snapshot is None:
+                return None
+            found = snapshot.find(key)
+            if found is None:
+                return None
+        name, points = found
+        return {"name": name, "points": points}
+
+    def record_registration(self, phone, name, points=0):
+        """Append a local registration to the delta log shared by all workers."""
+        key = encode_phone(phone)
+        if key is None:
+            return
+        # Write to the log of the newest snapshot this worker knows about
+        self._maybe_reload()
+        line = json.dumps({"phone": str(key), "name": name, "points": points}) + "\n"
+        try:
+            # A single short append is atomic, so workers can write concurrently
+            with open(self.delta_path, 'a', encoding='utf-8') as f:
+                f.write(line)
+        except OSError as e:
+            logger.error(f"Error writing user directory delta: {e}")
+            return
+        with self._lock:
+            deltas = dict(self._deltas)
+            deltas[key] = (name, points)
+            self._deltas = deltas
+
+    def __len__(self):
+        self._maybe_reload()
+        snapshot = self._snapshot
+        return snapshot.count if snapshot is not None else 0
+
+
+def fetch_all_users(page_size=DEFAULT_PAGE_SIZE):
+    """Yield (phone, name, points) for every user in Google Sheets."""
+    offset = 0
+    while True:
+        result = list_users_in_sheet(offset, page_size)
+        if not result or result.get("status") != "success":
+            message = (result or {}).get("message", "no response")
+            raise RuntimeError(f"could not list users from Google Sheets: {message}")
+        page = result.get("users", [])
+        for user in page:
+            yield user.get("phone"), user.get("name"), user.get("points", 0)
+        if len(page) < page_size:
+            return
+        offset += page_size
+
+
+def refresh_snapshot(path, page_size=DEFAULT_PAGE_SIZE):
+    """Rebuild the snapshot at `path` from Google Sheets.
+
+    Delta logs older than the generation being replaced are deleted. The
+    replaced generation's log is kept until the next refresh, since workers
+    may still append to it until they pick up the new snapshot.
+    """
+    start_time = time.time()
+    users = list(fetch_all_users(page_size))
+
+    # Registrations are written to Sheets before the delta log, so the export
+    # already has nearly all of them; write_snapshot carries over the rest
+    previous_generation = read_generation(path)
+    try:
+        with open(delta_log_path(path, previous_generation), 'rb') as f:
+            carried_deltas = f.readlines()
+    except FileNotFoundError:
+        carried_deltas = []
+
+    count = write_snapshot(path, users, carried_deltas)
+    generation = read_generation(path)
+
+    prefix = os.path.basename(path) + '.delta.'
+    directory = os.path.dirname(path) or '.'
+    for name in os.listdir(directory):
+        suffix = name[len(prefix):]
+        if name.startswith(prefix) and suffix.isdigit() and int(suffix) not in (generation, previous_generation):
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError as e:
+                logger.warning(f"Could not delete old delta log {name}: {e}")
+
+    logger.info(f"✅ User directory snapshot written: {count} users in {time.time() - start_time:.2f}s")
+    return count
+
+
+def main():
+    """Main function."""
+    parser = argparse.ArgumentParser(description="Refresh the local user directory snapshot.")
+    parser.add_argument('--path', default=os.getenv('USER_DIRECTORY_PATH', 'users.snapshot'))
+    parser.add_argument('--page-size', type=int, default=DEFAULT_PAGE_SIZE)
+    parser.add_argument('--interval', type=int, default=0,
+                        help="refresh every N seconds (default: refresh once and exit)")
+    args = parser.parse_args()
+
+    while True:
+        try:
+            refresh_snapshot(args.path, args.page_size)
+        except Exception as e:
+            logger.error(f"❌ Error refreshing user directory: {e}")
+            if not args.interval:
+                return 1
+        if not args.interval:
+            return 0
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -10,13 +10,17 @@ import random
 import requests
 import tempfile
 import base64
-import time
 from datetime import datetime, timedelta
 from flask import Flask, request, jsonify, make_response
 from dotenv import load_dotenv
 from langdetect import detect, LangDetectException
 import re
 import openai
+from user_directory import UserDirectory
+from media_pipeline import MediaPipeline
+from sheets_client import (register_user_in_sheet, find_user_in_sheet, check_balance_in_sheet,
+                           update_points_in_sheet, bulk_update_points_in_sheet, list_users_in_sheet)
+from responses import ReplyTurn, detect_language, render_parts, record_send, send_count_summary
 
 # Command keywords will be defined here for new commands
 
@@ -37,14 +41,18 @@ processed_messages = set()
 MAX_PROCESSED_MESSAGES = 1000  # Keep last 1000 message IDs in memory
 
 # In-memory user database and pending registration state
-users = {}  # {phone_number: name}
-pending_registrations = {}  # {phone_number: True}
+users = {}  # {phone_number: name}, users registered through this process
+pending_registrations = {}  # {phone_number: reply_language}
 
 # Store last responses for each user to enable "repeat message" functionality
 last_responses = {}  # {phone_number: last_response_text}
 
-# Google Sheets web app URL
-GOOGLE_SHEETS_WEBAPP_URL = "https://script.google.com/macros/s/AKfycbzp1Nhosh26AL96Ox1pKAGlXkUW4mctTDY5Xf9CiyUE0qxTfjnwLms0qkn5isFPWLpvyQ/exec"
+# Memory-mapped replica of the registered-user directory, refreshed by
+# running user_directory.py. Lookups fall back to Google Sheets on a miss.
+user_directory = UserDirectory(os.getenv('USER_DIRECTORY_PATH', 'users.snapshot'))
+
+# Background pool for downloading and processing image/document messages
+media_pipeline = MediaPipeline(reply=lambda to_number, message: send_response(to_number, message))
 
 # Audio response settings - disabled
 ENABLE_AUDIO_RESPONSES = False
@@ -127,16 +135,17 @@ def process_message(message_data):
             if response_result is None:
                 return
             
-            # Send response
-            send_response(from_number, response_result)
-            
-        elif message_type == 'image':
-            logger.info("   Image received - not supported")
-            send_response(from_number, "Image processing is not available.")
+            # Send the reply parts, coalesced into as few messages as possible
+            turn = ReplyTurn(from_number, send_response)
+            for part in response_result:
+                turn.add(part)
+            turn.flush()
             
-        elif message_type == 'document':
-            logger.info("   Document received")
-            send_response(from_number, "Document processing is not available.")
+        elif message_type in ('image', 'document'):
+            logger.info(f"   {message_type.capitalize()} received")
+            # Download and processing happen in the media pool, which replies when done
+            if not media_pipeline.submit(from_number, message_type, message_data.get(message_type, {})):
+                send_response(from_number, "We're receiving a lot of files right now. Please try again in a few minutes.")
             
         else:
             logger.info(f"   Unsupported message type: {message_type}")
@@ -150,35 +159,34 @@ def process_message(message_data):
 
 
 def generate_response(user_message, from_number):
-    """Generate response for user message."""
+    """Generate the reply parts for a user message, or None if there is no reply."""
     user_message_lower = user_message.lower().strip()
 
     # If user is pending registration, treat this message as their name
     if pending_registrations.get(from_number):
         name = user_message.strip()
+        language = pending_registrations.pop(from_number)
         reg_result = register_user_in_sheet(from_number, name)
-        pending_registrations.pop(from_number, None)
         if reg_result and reg_result.get("status") == "success":
-            return f"✅ Thank you, {name}! You have been registered successfully."
+            users[from_number] = name
+            user_directory.record_registration(from_number, name)
+            return render_parts('registered', language, name=name)
         else:
-            return f"❌ Sorry, there was a problem registering you. Please try again later."
+            return render_parts('register_failed', language)
 
     # Check for introduction/greeting messages
-    greeting_keywords = ['hello', 'hi', 'hey', 'good morning', 'good afternoon', 'good evening', 'salam', 'marhaba']
+    greeting_keywords = ['hello', 'hi', 'hey', 'good morning', 'good afternoon', 'good evening', 'salam', 'marhaba', 'مرحبا', 'السلام']
     if any(greeting in user_message_lower for greeting in greeting_keywords):
+        language = detect_language(user_message)
         # Check if user is registered
-        user_result = find_user_in_sheet(from_number)
+        user_result = find_registered_user(from_number)
         if user_result and user_result.get("status") == "success" and user_result.get("user_found"):
             user_name = user_result.get("name", "there")
-            return (f"👋 Hello {user_name}! Welcome back. How can I help you today?")
+            return render_parts('welcome_back', language, name=user_name)
         else:
             # User is not registered - prompt for name and set pending registration
-            pending_registrations[from_number] = True
-            return ("👋 Hello and welcome!\n"
-                    "I'm Jawhar, your friendly recycling assistant. ♻️\n"
-                    "Whether you are unsure about what to recycle, where to take items, or how to reduce waste I'm here to make it easy. 🌍✨\n"
-                    "I noticed you haven't registered yet - no worries! It's quick and easy.\n"
-                    "To get registered reply with your name.")
+            pending_registrations[from_number] = language
+            return render_parts('welcome_new', language)
     # No other commands implemented yet
     return None
 
@@ -212,6 +220,7 @@ def send_response(to_number, message, use_audio=False):
         response = requests.post(url, headers=headers, json=payload)
         logger.info(f"[DEBUG] WhatsApp API response status: {response.status_code}")
         logger.info(f"[DEBUG] WhatsApp API response text: {response.text}")
+        record_send(to_number)
         if response.status_code == 200:
             logger.info(f"✅ Response sent to {to_number}")
             logger.info(f"[DEBUG] Exiting send_response with success")
@@ -284,6 +293,12 @@ def receive_message():
         return make_response(jsonify({"status": "ok"}), 200)
 
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Outbound message counts per conversation."""
+    return jsonify(send_count_summary())
+
+
 @app.route('/')
 def home():
     """Home page."""
@@ -295,121 +310,45 @@ def home():
     '''
 
 
-def register_user_in_sheet(phone, name):
-    payload = {
-        "action": "register",
-        "phone": phone,
-        "name": name
-    }
-    try:
-        response = requests.post(GOOGLE_SHEETS_WEBAPP_URL, json=payload, timeout=5)
-        print("Sheets register response:", response.text)  # Debug print
-        
-        # Try to parse as JSON first, fallback to text
-        try:
-            return response.json()
-        except json.JSONDecodeError:
-            # If not JSON, treat as text response
-            return {"status": "success", "message": response.text.strip()}
-            
-    except Exception as e:
-        logger.error(f"Error registering user in Google Sheets: {e}")
-        return {"status": "error", "message": str(e)}
-
-def find_user_in_sheet(phone):
-    payload = {
-        "action": "find",
-        "phone": phone
-    }
-    try:
-        response = requests.post(GOOGLE_SHEETS_WEBAPP_URL, json=payload, timeout=5)
-        print("Sheets find response:", response.text)  # Debug print
-        
-        # Try to parse as JSON first, fallback to text
-        try:
-            return response.json()
-        except json.JSONDecodeError:
-            # If not JSON, treat as text response
-            return {"status": "success", "message": response.text.strip()}
-            
-    except Exception as e:
-        logger.error(f"Error looking up user in Google Sheets: {e}")
-        return {"status": "error", "message": str(e)}
-
-def check_balance_in_sheet(phone):
-    """Check user's points balance in Google Sheets."""
-    payload = {
-        "action": "check_balance",
-        "phone": phone
-    }
-    try:
-        response = requests.post(GOOGLE_SHEETS_WEBAPP_URL, json=payload, timeout=5)
-        print("Sheets balance response:", response.text)  # Debug print
-        
-        try:
-            return response.json()
-        except json.JSONDecodeError:
-            return {"status": "error", "message": "Invalid response format"}
-            
-    except Exception as e:
-        logger.error(f"Error checking balance in Google Sheets: {e}")
-        return {"status": "error", "message": str(e)}
-
-def update_points_in_sheet(phone, points_to_add, admin_secret):
-    """Update user's points in Google Sheets (admin only)."""
-    payload = {
-        "action": "update_points",
-        "phone": phone,
-        "points": points_to_add,
-        "admin_secret": admin_secret
-    }
-    try:
-        response = requests.post(GOOGLE_SHEETS_WEBAPP_URL, json=payload, timeout=5)
-        print("Sheets update points response:", response.text)  # Debug print
-        
-        try:
-            return response.json()
-        except json.JSONDecodeError:
-            return {"status": "error", "message": "Invalid response format"}
-            
-    except Exception as e:
-        logger.error(f"Error updating points in Google Sheets: {e}")
-        return {"status": "error", "message": str(e)}
+def find_registered_user(phone):
+    """Look up a user in the local directory first, then in Google Sheets."""
+    if phone in users:
+        return {"status": "success", "user_found": True, "name": users[phone]}
 
-# Audio and image processing functions removed
+    local_user = user_directory.lookup(phone)
+    if local_user:
+        return {"status": "success", "user_found": True,
+                "name": local_user["name"], "points": local_user["points"]}
 
-def handle_introduction(from_number):
+    # Not in the replica (yet) - the sheet is the source of truth
+    return find_user_in_sheet(phone)
+
+# Audio processing functions removed, media handling lives in media_pipeline.py
+
+def handle_introduction(from_number, language='en'):
     """Handle introduction and check if user is registered."""
     try:
-        # Check if user exists in Google Sheets
-        user_result = find_user_in_sheet(from_number)
+        # Check if user exists in the local directory or Google Sheets
+        user_result = find_registered_user(from_number)
             
         if user_result and user_result.get("status") == "success" and user_result.get("user_found"):
             # User is registered
             user_name = user_result.get("name", "there")
-            return (f"👋 Hello {user_name}! Welcome back. How can I help you today?")
+            return render_parts('welcome_back', language, name=user_name)
         else:
-            # User is not registered - send multiple welcome messages
-            return handle_new_user_welcome(from_number)
+            # User is not registered - send the welcome messages
+            return handle_new_user_welcome(from_number, language)
             
     except Exception as e:
         logger.error(f"Error handling introduction: {e}")
-        return handle_new_user_welcome(from_number)
-
-def handle_new_user_welcome(from_number):
-    """Send multiple welcome messages for new users."""
-    messages = [
-        "👋 Hello and welcome!",
-        "I'm Jawhar, your friendly recycling assistant. ♻️",
-        "Whether you are unsure about what to recycle, where to take items, or how to reduce waste I'm here to make it easy. 🌍✨",
-        "I noticed you haven't registered yet - no worries! It's quick and easy.",
-        "To get registered reply with your name."
-    ]
-    
-    # Send each message separately
-    for message in messages:
-        send_response(from_number, message)
-        time.sleep(0.5)  # Small delay between messages
+        return handle_new_user_welcome(from_number, language)
+
+def handle_new_user_welcome(from_number, language='en'):
+    """Send the welcome messages for new users."""
+    # All parts go out together, in as few messages as the length limit allows
+    turn = ReplyTurn(from_number, send_response, language)
+    turn.add_template('welcome_new')
+    turn.flush()
     
     return None  # Return None since we handled the response manually
 